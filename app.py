@@ -1,13 +1,25 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, jsonify, redirect, session, request, render_template
-from client.client import Client, generate_random_string
+import os
+import hmac
+import secrets
+import functools
+from flask import Flask, Blueprint, jsonify, redirect, session, request, render_template
+from client.client import Client
 from client.config import Config
 from client.validator import JwtValidatorException, JwtValidator
 from client.session import Session
 from client.user import User
 from client.db_interface import OAuth2Db
+from client.rate_limit import create_limiter, RateLimitExceededException
+from client.resilience import CircuitOpenException
+from client.introspection import TokenIntrospector
+from client.user_cache import UserProfileCache
+from client.state_store import create_state_store
+from client.tracing import tracer, configure_tracing, RingBufferExporter
 from db_impl.sqlite import OAuthSqlite
 from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 
 def generic_error_handler(error_object, status_code):
@@ -63,20 +75,79 @@ class BadRequest(AppBaseException):
         AppBaseException.__init__(self, message, status_code, payload)
 
 
+class TooManyRequests(AppBaseException):
+    def __init__(self, message, status_code=429, payload=None):
+        AppBaseException.__init__(self, message, status_code, payload)
+
+
 class InternalServerError(AppBaseException):
     def __init__(self, message, status_code=500, payload=None):
         AppBaseException.__init__(self, message, status_code, payload)
 
 
-app = Flask(__name__)
+oauth2 = Blueprint('oauth2', __name__)
+
+_db: OAuth2Db = None
+_config: Config = None
+_client: Client = None
+_jwt_validator: JwtValidator = None
+_index_limiter = None
+_callback_limiter = None
+_introspect_limiter = None
+_introspector: TokenIntrospector = None
+_user_cache: UserProfileCache = None
+_state_store = None
+
+
+def safe_return_url(url) -> str:
+    """
+    Only local paths are accepted as return url, to avoid open redirect. Browsers drop tabs and newlines
+    from Location, so "/\t/evil.com" would become "//evil.com", control characters and whitespace are refused.
+    """
+    if url is None or not url.startswith("/") or url.startswith("//") or "\\" in url:
+        return "/"
+    if any(ord(char) <= 0x20 or 0x7f == ord(char) for char in url):
+        return "/"
+    parts = urlsplit(url)
+    if parts.scheme or parts.netloc:
+        return "/"
+    return url
 
 
-@app.errorhandler(AppBaseException)
+def traced_route(name):
+    """
+    Run route in root span, trace of incoming traceparent header is continued
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name, request.headers.get("traceparent"), path=request.path):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def check_rate_limit(limiter) -> None:
+    if limiter is not None and not limiter.allow(request.remote_addr or ""):
+        raise TooManyRequests('Too many requests')
+
+
+@oauth2.app_errorhandler(AppBaseException)
 def handle_invalid_usage(error):
     return generic_error_handler(error, error.status_code)
 
 
-@app.errorhandler(JwtValidatorException)
+@oauth2.app_errorhandler(RateLimitExceededException)
+def handle_outbound_rate_limit(error):
+    return generic_error_handler(error, 429)
+
+
+@oauth2.app_errorhandler(CircuitOpenException)
+def handle_circuit_open(error):
+    return generic_error_handler(error, 503)
+
+
+@oauth2.app_errorhandler(JwtValidatorException)
 def handle_invalid_jwt(error):
     resp_dict = {
         "success": False,
@@ -87,7 +158,7 @@ def handle_invalid_jwt(error):
     response.status_code = 500
     return response
 
-@app.errorhandler(HTTPError)
+@oauth2.app_errorhandler(HTTPError)
 def handle_invalid_http(error: HTTPError):
     resp_dict = {
         "success": False,
@@ -100,8 +171,10 @@ def handle_invalid_http(error: HTTPError):
     return response
 
 
-@app.route('/', methods=['GET'])
+@oauth2.route('/', methods=['GET'])
+@traced_route('index')
 def index():
+    check_rate_limit(_index_limiter)
     user = None
     if 'session_id' in session:
         user_session = _db.get_session(session['session_id'])
@@ -109,8 +182,11 @@ def index():
             user = user_session[1]
 
     if user is None:
+        # set once per browser, so the cookie is not rewritten on every login
+        if 'browser_id' not in session:
+            session['browser_id'] = secrets.token_urlsafe(16)
         login_url = _client.get_authn_req_url(
-            session,
+            _state_store.create(session['browser_id'], safe_return_url(request.args.get("next", None))),
             request.args.get("acr", None),
             request.args.get("forceAuthN", False)
         )
@@ -119,17 +195,21 @@ def index():
         return render_template('index.html', username=user.get_email(), provider=_config.get_authorization_endpoint())
 
 
-@app.route('/callback', methods=['GET'])
+@oauth2.route('/callback', methods=['GET'])
+@traced_route('redirect_uri_handler')
 def redirect_uri_handler():
+    check_rate_limit(_callback_limiter)
     token_is_valid = False
-    if 'state' not in session or session['state'] != request.args['state']:
+    id_token_claims = None
+    pending = _state_store.take(request.args.get('state', ''), session.get('browser_id', None))
+    if pending is None:
         raise BadRequest('Missing or invalid state')
 
     if 'code' not in request.args:
         raise BadRequest('No code in response')
 
     try:
-        token_data = _client.get_token(request.args['code'])
+        token_data = _client.get_token(request.args['code'], pending.get_code_verifier())
         if "error" in token_data:
             err_response = jsonify({
                 "success": False,
@@ -139,9 +219,10 @@ def redirect_uri_handler():
             })
             err_response.status_code = 500
             return err_response
+    except (RateLimitExceededException, CircuitOpenException) as e:
+        raise e
     except Exception as e:
         raise BadRequest('Could not fetch token(s): ' + str(e))
-    session.pop('state', None)
 
     # Store in basic server session, since flask session use cookie for storage
     user_session = Session()
@@ -156,10 +237,16 @@ def redirect_uri_handler():
             raise BadRequest('Could not validate token: no issuer configured')
 
         try:
-            _jwt_validator.validate(token_data['id_token'], _config.get_issuer(), _config.get_client_id())
+            id_token_claims = _jwt_validator.validate(
+                token_data['id_token'], _config.get_issuer(), _config.get_client_id()
+            )
+            if id_token_claims.get("nonce") != pending.get_nonce():
+                raise JwtValidatorException('Invalid nonce')
             token_is_valid = True
         except JwtValidatorException as bs:
             raise BadRequest('Could not validate token: ' + str(bs))
+        except (RateLimitExceededException, CircuitOpenException) as e:
+            raise e
         except Exception as ve:
             raise BadRequest('Unexpected exception: ' + str(ve))
 
@@ -171,25 +258,123 @@ def redirect_uri_handler():
     if 'refresh_token' in token_data:
         user_session.set_refresh_token(token_data['refresh_token'])
 
-    user_info = _client.get_user_info(user_session.get_access_token())
-    if "email" not in user_info:
-        user = User(email=None, sub=user_info["sub"])
-    else:
-        user = User(email=user_info["email"], sub=user_info["sub"])
+    # recent profile of the same subject replaces userinfo call and needs no db write
+    user = _user_cache.get_fresh(id_token_claims["sub"])
+    fetched = user is None
+    save_user = False
+    if fetched:
+        user_info = _client.get_user_info(user_session.get_access_token())
+        # OIDC Core 5.3.2, userinfo of other subject must not be used
+        if user_info is not None and user_info.get("sub") != id_token_claims["sub"]:
+            raise BadRequest('Userinfo subject does not match id token')
+        user = User.from_claims(id_token_claims if user_info is None else user_info)
+        save_user = _user_cache.is_changed(user)
     user_session.set_user_sub(user.get_sub())
-    _db.save_session(user_session, user)
+    _db.save_session(user_session, user, save_user)
+    if fetched:
+        _user_cache.put(user)
     session['session_id'] = user_session.get_id()
-    return redirect('/')
+    return redirect(pending.get_return_url())
 
 
-if __name__ == '__main__':
-    _db: OAuth2Db = OAuthSqlite()
-    _config: Config = Config()
-    _client: Client = Client(_config, _db)
+@oauth2.route('/introspect', methods=['POST'])
+@traced_route('introspect')
+def introspect():
+    clients = _config.get_introspection_clients()
+    if 0 == len(clients):
+        raise BadRequest('Introspection is not enabled', status_code=404)
+    check_rate_limit(_introspect_limiter)
+
+    auth = request.authorization
+    if auth is None or auth.username not in clients or \
+            not hmac.compare_digest(str(clients[auth.username]), auth.password or ""):
+        raise BadRequest('Unauthorized', status_code=401)
+
+    body = request.get_json(silent=True)
+    if isinstance(body, dict) and isinstance(body.get("tokens"), list):
+        if len(body["tokens"]) > _config.get_introspection_max_batch():
+            raise BadRequest('Too many tokens, at most %d are allowed' % _config.get_introspection_max_batch())
+        return jsonify({"results": _introspector.introspect_many([str(token) for token in body["tokens"]])})
+    if 'token' not in request.form:
+        raise BadRequest('No token in request')
+    return jsonify(_introspector.introspect(request.form['token']))
+
+
+@oauth2.route('/debug/traces', methods=['GET'])
+def debug_traces():
+    exporter = tracer.get_exporter()
+    if not _config.tracing_debug_endpoint_enabled() or not isinstance(exporter, RingBufferExporter):
+        raise BadRequest('Tracing debug endpoint is not enabled', status_code=404)
+    return jsonify({"spans": exporter.get_spans(request.args.get("trace_id", None))})
+
+
+def init_components(config: Config=None, db: OAuth2Db=None, multi_process: bool=False) -> None:
+    """
+    Create db, config, client and validator. Discovery, dynamic registration and JWKS are loaded here,
+    so calling this in a parent process before fork shares them with all workers.
+    :param multi_process: app is served by more worker processes, pending authorizations are stored in db
+    """
+    global _db, _config, _client, _jwt_validator, _index_limiter, _callback_limiter, _introspect_limiter, \
+        _introspector, _user_cache, _state_store
+    _db = OAuthSqlite() if db is None else db
+    _config = Config() if config is None else config
+    configure_tracing(_config)
+    _client = Client(_config, _db)
     _jwt_validator = JwtValidator(_config)
+    _index_limiter = create_limiter("index", _config, _db)
+    _callback_limiter = create_limiter("callback", _config, _db)
+    _introspect_limiter = create_limiter("introspect", _config, _db)
+    _state_store = create_state_store(_config, _db, multi_process)
+    _user_cache = UserProfileCache(_config.get_user_profile_ttl(), _config.get_user_profile_cache_size())
+    _client.warm_up()
+    _jwt_validator.warm_up()
+    # created after warm up, so audience is checked against dynamically registered client id
+    _introspector = TokenIntrospector(_config, _client, _jwt_validator)
+
+
+def load_secret_key(config: Config) -> str:
+    """
+    Flask session secret key shared by all workers, taken from config or from secret key file,
+    which is created on first use
+    """
+    if 0 < len(config.get_secret_key()):
+        return config.get_secret_key()
+
+    path = config.get_secret_key_file()
+    if not os.path.exists(path):
+        # complete key is written to temporary file and linked into place, so readers never see partial key
+        # and when more processes race, the first link wins and all of them read the same key
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(secrets.token_hex(32))
+            fp.flush()
+            os.fsync(fp.fileno())
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+    with open(path) as fp:
+        return fp.read().strip()
 
-    # Flask session secret key
-    app.secret_key = generate_random_string()
 
-    # app.run(host='127.0.0.1', port=22222, threaded=True)
-    app.run(debug=True)
+def create_app(secret_key: str=None) -> Flask:
+    """
+    :param secret_key: Flask session secret key, loaded by load_secret_key when not given
+    """
+    if _client is None:
+        init_components()
+
+    flask_app = Flask(__name__)
+    flask_app.secret_key = load_secret_key(_config) if secret_key is None else secret_key
+    flask_app.register_blueprint(oauth2)
+    if 0 < _config.get_trusted_proxy_count():
+        # client address used by rate limits is taken from X-Forwarded-For set by trusted proxies
+        flask_app.wsgi_app = ProxyFix(flask_app.wsgi_app, x_for=_config.get_trusted_proxy_count())
+    return flask_app
+
+
+if __name__ == '__main__':
+    create_app().run(debug=True)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput of local JWT introspection, cold validations against cached results and batches.
+Tokens are signed with a generated HS256 key, no provider is needed.
+
+Usage:
+    python benchmarks/introspection.py --tokens 2000 --batch 100
+"""
+import os
+import io
+import sys
+import json
+import base64
+import argparse
+import contextlib
+from time import time, perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client.config import Config
+from client.introspection import TokenIntrospector
+from client.validator import JwtValidator, load_jose
+
+ISSUER = "https://issuer.example.com"
+AUDIENCE = "benchmark-api"
+
+
+class BenchmarkConfig(Config):
+    def get_introspection_audience(self) -> str:
+        return AUDIENCE
+
+
+def report(name: str, count: int, elapsed: float) -> None:
+    print("%-24s %8d tokens %8.3f s %10.0f tokens/s" % (name, count, elapsed, count / elapsed))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Introspection benchmark")
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    jws = load_jose()[0]
+    secret = os.urandom(32)
+    jwks = {"keys": [{"kty": "oct", "alg": "HS256", "k": base64.urlsafe_b64encode(secret).decode().rstrip("=")}]}
+
+    config = BenchmarkConfig()
+    config.set_discovery_content({"issuer": ISSUER})
+    config.set_dynamic_configuration({"client_id": "benchmark"})
+    validator = JwtValidator(config)
+    validator.jwks = json.dumps(jwks)
+
+    now = int(time())
+    tokens = [
+        jws.sign({"iss": ISSUER, "aud": AUDIENCE, "sub": "user%d" % i, "exp": now + 3600}, secret, algorithm="HS256")
+        for i in range(args.tokens)
+    ]
+
+    introspector = TokenIntrospector(config, None, validator)
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = perf_counter()
+        for token in tokens:
+            assert introspector.introspect(token)["active"]
+        cold = perf_counter() - started
+
+        started = perf_counter()
+        for token in tokens:
+            introspector.introspect(token)
+        cached = perf_counter() - started
+
+        started = perf_counter()
+        for i in range(0, len(tokens), args.batch):
+            introspector.introspect_many(tokens[i:i + args.batch])
+        batched = perf_counter() - started
+
+    report("validation (cold)", len(tokens), cold)
+    report("cache hit", len(tokens), cached)
+    report("batch of %d (cached)" % args.batch, len(tokens), batched)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
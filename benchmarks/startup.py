@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Cold-start benchmark based on python -X importtime. Every module is imported in a fresh interpreter,
+cumulative import time is compared with startup_baseline.json.
+
+Usage:
+    python benchmarks/startup.py                 # compare with baseline
+    python benchmarks/startup.py --update        # record new baseline
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+from statistics import median
+from typing import Union
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "benchmarks", "startup_baseline.json")
+MODULES = ["client.client", "client.validator", "db_impl.sqlite", "app"]
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure(module: str) -> Union[int, None]:
+    """
+    :return: cumulative import time of module in microseconds, None when module cannot be imported
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    if 0 != result.returncode:
+        return None
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match and module == match.group(4) and 1 == len(match.group(3)):
+            return int(match.group(2))
+    return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import time benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown factor against baseline")
+    parser.add_argument("--update", action="store_true", help="write results as new baseline")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as fp:
+            baseline = json.load(fp)
+
+    results = {}
+    regressions = 0
+    for module in MODULES:
+        samples = [measure(module) for _ in range(args.repeat)]
+        if None in samples:
+            print("%-20s not importable, skipped" % module)
+            continue
+        results[module] = int(median(samples))
+        line = "%-20s %8d us" % (module, results[module])
+        if module in baseline:
+            line += "  baseline %8d us" % baseline[module]
+            if results[module] > baseline[module] * args.tolerance:
+                line += "  REGRESSION"
+                regressions += 1
+        print(line)
+
+    if args.update:
+        baseline.update(results)
+        with open(BASELINE, "w") as fp:
+            json.dump(baseline, fp, indent=2, sort_keys=True)
+            fp.write("\n")
+        return 0
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,12 +2,16 @@ import json
 from time import time
 from ssl import SSLContext
 from urllib.parse import urlencode
-from urllib.request import Request, urlopen
+from urllib.request import Request
 from urllib.error import URLError
 from client.config import Config
 from typing import Union
 from client.db_interface import OAuth2Db
-from client.utils import get_ssl_context, generate_random_string
+from client.rate_limit import create_limiter
+from client.resilience import ResilientOpener
+from client.state_store import PendingAuthorization
+from client.tls import tls_manager
+from client.tracing import traced
 
 
 class Client:
@@ -15,14 +19,35 @@ class Client:
         self.config: Config = config
         self.db: OAuth2Db = db
 
+        self.ctx: SSLContext = None
+        self.opener: ResilientOpener = ResilientOpener(self.config, create_limiter("outbound", self.config, self.db))
+        self.__warmed_up: bool = False
+
+    def warm_up(self) -> None:
+        """
+        Load ssl context, discovery and dynamic registration. Constructor does no I/O, so this has to be
+        called before the client is used.
+        """
+        if self.__warmed_up:
+            return
         print('Getting ssl context for oauth server')
-        self.ctx: SSLContext = get_ssl_context(self.config)
+        self.ctx = tls_manager.get_context(self.config)
         self.__init_config()
+        self.__warmed_up = True
+
+    async def async_warm_up(self) -> None:
+        import asyncio
+        await asyncio.get_running_loop().run_in_executor(None, self.warm_up)
 
     def __init_config(self):
         if self.config.get_discovery_url() is not None and len(self.config.get_discovery_url()) > 0:
-            discovery = self.urlopen(self.config.get_discovery_url(), context=self.ctx)
-            self.config.set_discovery_content(json.loads(discovery.read()))
+            discovery = self.opener.open(
+                "discovery",
+                Client.build_request(self.config.get_discovery_url()),
+                context=self.ctx,
+                idempotent=True
+            )
+            self.config.set_discovery_content(json.loads(discovery))
         else:
             print("No discovery url configured, all endpoints needs to be configured manually")
 
@@ -70,7 +95,7 @@ class Client:
         )
         self.config.set_dynamic_configuration(
             json.loads(
-                urlopen(request, context=self.ctx).read()
+                self.opener.open("registration", request, context=self.ctx)
             )
         )
         self.db.save_dynamic_registration(self.config.get_app_name(), self.config.get_dynamic_configuration())
@@ -103,7 +128,7 @@ class Client:
         )
         self.config.set_dynamic_configuration(
             json.loads(
-                urlopen(request, context=self.ctx).read()
+                self.opener.open("registration", request, context=self.ctx)
             )
         )
         self.db.save_dynamic_registration(self.config.get_app_name(), self.config.get_dynamic_configuration())
@@ -123,7 +148,11 @@ class Client:
             'client_id': self.config.get_client_id(),
             'client_secret': self.config.get_client_secret()
         }
-        self.urlopen(self.config.get_revocation_endpoint(), urlencode(data), context=self.ctx)
+        self.opener.open(
+            "revocation",
+            Client.build_request(self.config.get_revocation_endpoint(), urlencode(data).encode("utf-8")),
+            context=self.ctx
+        )
 
     def refresh(self, refresh_token):
         """
@@ -137,17 +166,38 @@ class Client:
             'client_id': self.config.get_client_id(),
             'client_secret': self.config.get_client_secret()
         }
-        token_response = self.urlopen(
-            self.config.get_token_endpoint(),
-            urlencode(data).encode("utf-8"),
+        token_response = self.opener.open(
+            "token",
+            Client.build_request(self.config.get_token_endpoint(), urlencode(data).encode("utf-8")),
             context=self.ctx
         )
-        return json.loads(token_response.read())
+        return json.loads(token_response)
 
-    def get_authn_req_url(self, session, acr, force_auth_n):
-        state = generate_random_string()
-        session['state'] = state
-        request_args = self.__authn_req_args(state)
+    def introspect(self, token: str) -> dict:
+        """
+        Introspect token at provider's introspection endpoint
+        :param token: the token to introspect
+        :return: the json introspection response
+        """
+        data = {
+            'token': token,
+            'token_type_hint': 'access_token',
+            'client_id': self.config.get_client_id(),
+            'client_secret': self.config.get_client_secret()
+        }
+        introspection_response = self.opener.open(
+            "introspection",
+            Client.build_request(self.config.get_introspection_endpoint(), urlencode(data).encode("utf-8")),
+            context=self.ctx,
+            idempotent=True
+        )
+        return json.loads(introspection_response)
+
+    def get_authn_req_url(self, pending: PendingAuthorization, acr, force_auth_n):
+        """
+        :param pending: server side state, nonce and PKCE verifier of this authorization request
+        """
+        request_args = self.__authn_req_args(pending)
         if acr:
             request_args["acr_values"] = acr
         if force_auth_n:
@@ -156,28 +206,33 @@ class Client:
         print("Redirect to federation service %s" % login_url)
         return login_url
 
-    def get_token(self, code):
+    @traced("Client.get_token")
+    def get_token(self, code, code_verifier=None):
         """
         :param code: The authorization code to use when getting tokens
+        :param code_verifier: PKCE verifier of the authorization request
         :return the json response containing the tokens
         """
         data = {'client_id': self.config.get_client_id(), "client_secret": self.config.get_client_secret(),
                 'code': code,
                 'redirect_uri': self.config.get_redirect_uri(),
                 'grant_type': 'authorization_code'}
+        if code_verifier is not None:
+            data['code_verifier'] = code_verifier
 
         # Exchange code for tokens
         try:
-            token_response = self.urlopen(
-                self.config.get_token_endpoint(),
-                urlencode(data).encode("utf-8"),
+            token_response = self.opener.open(
+                "token",
+                Client.build_request(self.config.get_token_endpoint(), urlencode(data).encode("utf-8")),
                 context=self.ctx
             )
         except URLError as te:
             print("Could not exchange code for tokens")
             raise te
-        return json.loads(token_response.read())
+        return json.loads(token_response)
 
+    @traced("Client.get_user_info")
     def get_user_info(self, user_token: str) -> Union[dict, None]:
         if 0 == len(self.config.get_userinfo_endpoint()):
             return None
@@ -191,11 +246,11 @@ class Client:
         print(self.config.get_userinfo_endpoint())
         print("Authorization: Bearer " + user_token)
         return json.loads(
-            urlopen(request, context=self.ctx).read()
+            self.opener.open("userinfo", request, context=self.ctx, idempotent=True)
         )
 
     @staticmethod
-    def urlopen(url, data=None, context=None):
+    def build_request(url, data=None) -> Request:
         headers = {
             'User-Agent':
                 'CurityExample/1.0',
@@ -203,18 +258,20 @@ class Client:
                 'application/json,text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8'
         }
         
-        request = Request(url, data, headers)
-        return urlopen(request, context=context)
+        return Request(url, data, headers)
 
-    def __authn_req_args(self, state):
+    def __authn_req_args(self, pending: PendingAuthorization):
         """
-        :param state: state to send to authorization server
+        :param pending: pending authorization with state to send to authorization server
         :return a map of arguments to be sent to the authz endpoint
         """
         args = {'scope': self.config.get_scope(),
                 'response_type': 'code',
                 'client_id': self.config.get_client_id(),
-                'state': state,
+                'state': pending.get_state(),
+                'nonce': pending.get_nonce(),
+                'code_challenge': pending.get_code_challenge(),
+                'code_challenge_method': 'S256',
                 'redirect_uri': self.config.get_redirect_uri()}
 
         if 0 == len(self.config.get_authn_parameters()):
@@ -1,7 +1,7 @@
 import os
 import json
 from json.decoder import JSONDecodeError
-from typing import Union
+from typing import Tuple, Union
 
 
 class Config(object):
@@ -16,6 +16,36 @@ class Config(object):
         self.__base_url: str = ""
         self.__app_name: str = "js-oauth2"
         self.__userinfo_endpoint = ""
+        self.__secret_key: str = ""
+        self.__secret_key_file: str = ".secret_key"
+        self.__trusted_proxy_count: int = 0
+        self.__timeouts: dict = {"default": 10.0}
+        self.__circuit_failure_threshold: int = 5
+        self.__circuit_reset_timeout: float = 30.0
+        self.__retry_attempts: int = 3
+        self.__retry_backoff: float = 0.2
+        self.__hedge_delay: float = 0.0
+        self.__ca_bundle: str = ""
+        self.__pinned_certificates: list = []
+        self.__rate_limits: dict = {}
+        self.__rate_limit_backend: str = "memory"
+        self.__rate_limit_max_keys: int = 10000
+        self.__introspection_audience: str = ""
+        self.__introspection_clients: dict = {}
+        self.__introspection_cache_size: int = 10000
+        self.__introspection_cache_ttl: float = 60.0
+        self.__introspection_max_batch: int = 100
+        self.__user_profile_ttl: float = 300.0
+        self.__user_profile_cache_size: int = 10000
+        self.__pending_authorization_ttl: float = 300.0
+        self.__pending_authorization_capacity: int = 10000
+        self.__pending_authorization_backend: str = "memory"
+        self.__tracing_exporter: str = "none"
+        self.__tracing_sample_rate: float = 0.0
+        self.__tracing_buffer_size: int = 1000
+        self.__tracing_file: str = "traces.ndjson"
+        self.__tracing_debug_endpoint: bool = False
+        self.__tracing_trust_traceparent: bool = False
         self.__load_config_file()
 
     def __load_config_file(self) -> None:
@@ -41,6 +71,66 @@ class Config(object):
                     self.__app_name = local_config["app_name"]
                 if "userinfo_endpoint" in local_config:
                     self.__userinfo_endpoint = local_config["userinfo_endpoint"]
+                if "secret_key" in local_config:
+                    self.__secret_key = local_config["secret_key"]
+                if "secret_key_file" in local_config:
+                    self.__secret_key_file = local_config["secret_key_file"]
+                if "trusted_proxy_count" in local_config:
+                    self.__trusted_proxy_count = int(local_config["trusted_proxy_count"])
+                if "timeouts" in local_config:
+                    self.__timeouts.update(local_config["timeouts"])
+                if "circuit_failure_threshold" in local_config:
+                    self.__circuit_failure_threshold = int(local_config["circuit_failure_threshold"])
+                if "circuit_reset_timeout" in local_config:
+                    self.__circuit_reset_timeout = float(local_config["circuit_reset_timeout"])
+                if "retry_attempts" in local_config:
+                    self.__retry_attempts = max(1, int(local_config["retry_attempts"]))
+                if "retry_backoff" in local_config:
+                    self.__retry_backoff = float(local_config["retry_backoff"])
+                if "hedge_delay" in local_config:
+                    self.__hedge_delay = float(local_config["hedge_delay"])
+                if "ca_bundle" in local_config:
+                    self.__ca_bundle = local_config["ca_bundle"]
+                if "pinned_certificates" in local_config:
+                    self.__pinned_certificates = local_config["pinned_certificates"]
+                if "rate_limits" in local_config:
+                    self.__rate_limits = local_config["rate_limits"]
+                if "rate_limit_backend" in local_config:
+                    self.__rate_limit_backend = local_config["rate_limit_backend"]
+                if "rate_limit_max_keys" in local_config:
+                    self.__rate_limit_max_keys = int(local_config["rate_limit_max_keys"])
+                if "introspection_audience" in local_config:
+                    self.__introspection_audience = local_config["introspection_audience"]
+                if "introspection_clients" in local_config:
+                    self.__introspection_clients = local_config["introspection_clients"]
+                if "introspection_cache_size" in local_config:
+                    self.__introspection_cache_size = int(local_config["introspection_cache_size"])
+                if "introspection_cache_ttl" in local_config:
+                    self.__introspection_cache_ttl = float(local_config["introspection_cache_ttl"])
+                if "introspection_max_batch" in local_config:
+                    self.__introspection_max_batch = int(local_config["introspection_max_batch"])
+                if "user_profile_ttl" in local_config:
+                    self.__user_profile_ttl = float(local_config["user_profile_ttl"])
+                if "user_profile_cache_size" in local_config:
+                    self.__user_profile_cache_size = int(local_config["user_profile_cache_size"])
+                if "pending_authorization_ttl" in local_config:
+                    self.__pending_authorization_ttl = float(local_config["pending_authorization_ttl"])
+                if "pending_authorization_capacity" in local_config:
+                    self.__pending_authorization_capacity = int(local_config["pending_authorization_capacity"])
+                if "pending_authorization_backend" in local_config:
+                    self.__pending_authorization_backend = local_config["pending_authorization_backend"]
+                if "tracing_exporter" in local_config:
+                    self.__tracing_exporter = local_config["tracing_exporter"]
+                if "tracing_sample_rate" in local_config:
+                    self.__tracing_sample_rate = float(local_config["tracing_sample_rate"])
+                if "tracing_buffer_size" in local_config:
+                    self.__tracing_buffer_size = int(local_config["tracing_buffer_size"])
+                if "tracing_file" in local_config:
+                    self.__tracing_file = local_config["tracing_file"]
+                if "tracing_debug_endpoint" in local_config:
+                    self.__tracing_debug_endpoint = local_config["tracing_debug_endpoint"]
+                if "tracing_trust_traceparent" in local_config:
+                    self.__tracing_trust_traceparent = local_config["tracing_trust_traceparent"]
             except JSONDecodeError as _:
                 pass
 
@@ -84,6 +174,76 @@ class Config(object):
         else:
             return ret
 
+    def get_introspection_endpoint(self) -> str:
+        ret = self.__get_discovered("introspection_endpoint")
+        if ret is None:
+            return ""
+        else:
+            return ret
+
+    def get_introspection_audience(self) -> str:
+        """
+        :return: audience of access tokens accepted by introspection, empty when not configured
+        """
+        return self.__introspection_audience
+
+    def get_introspection_clients(self) -> dict:
+        """
+        :return: credentials of resource servers allowed to call introspection API, client id -> secret
+        """
+        return self.__introspection_clients
+
+    def get_introspection_cache_size(self) -> int:
+        return self.__introspection_cache_size
+
+    def get_introspection_cache_ttl(self) -> float:
+        return self.__introspection_cache_ttl
+
+    def get_introspection_max_batch(self) -> int:
+        return self.__introspection_max_batch
+
+    def get_user_profile_ttl(self) -> float:
+        """
+        :return: seconds for which cached user profile replaces userinfo call
+        """
+        return self.__user_profile_ttl
+
+    def get_user_profile_cache_size(self) -> int:
+        return self.__user_profile_cache_size
+
+    def get_pending_authorization_ttl(self) -> float:
+        return self.__pending_authorization_ttl
+
+    def get_pending_authorization_capacity(self) -> int:
+        return self.__pending_authorization_capacity
+
+    def get_pending_authorization_backend(self) -> str:
+        return self.__pending_authorization_backend
+
+    def get_tracing_exporter(self) -> str:
+        """
+        :return: none, memory or file
+        """
+        return self.__tracing_exporter
+
+    def get_tracing_sample_rate(self) -> float:
+        return self.__tracing_sample_rate
+
+    def get_tracing_buffer_size(self) -> int:
+        return self.__tracing_buffer_size
+
+    def get_tracing_file(self) -> str:
+        return self.__tracing_file
+
+    def tracing_debug_endpoint_enabled(self) -> bool:
+        return self.__tracing_debug_endpoint
+
+    def tracing_traceparent_trusted(self) -> bool:
+        """
+        :return: sampled flag of incoming traceparent forces sampling, enable only behind trusted callers
+        """
+        return self.__tracing_trust_traceparent
+
     def get_registration_endpoint(self) -> str:
         ret = self.__get_discovered("registration_endpoint")
         if ret is None:
@@ -97,6 +257,67 @@ class Config(object):
     def get_app_name(self) -> str:
         return self.__app_name
 
+    def get_secret_key(self) -> str:
+        return self.__secret_key
+
+    def get_secret_key_file(self) -> str:
+        return self.__secret_key_file
+
+    def get_trusted_proxy_count(self) -> int:
+        """
+        :return: number of reverse proxies in front of the app, whose X-Forwarded-For header is trusted
+        """
+        return self.__trusted_proxy_count
+
+    def get_ca_bundle(self) -> str:
+        return self.__ca_bundle
+
+    def get_pinned_certificates(self) -> list:
+        """
+        :return: SHA-256 fingerprints of accepted provider certificates, empty list disables pinning
+        """
+        return self.__pinned_certificates
+
+    def get_rate_limit(self, name: str) -> Union[Tuple[float, int], None]:
+        """
+        :param name: rate limit name, e.g. index, callback, outbound
+        :return: tokens per second and burst size, None when not limited
+        """
+        if name not in self.__rate_limits:
+            return None
+        limit = self.__rate_limits[name]
+        return float(limit["rate"]), int(limit.get("burst", max(1, int(limit["rate"]))))
+
+    def get_rate_limit_backend(self) -> str:
+        return self.__rate_limit_backend
+
+    def get_rate_limit_max_keys(self) -> int:
+        return self.__rate_limit_max_keys
+
+    def get_timeout(self, endpoint: str) -> float:
+        """
+        :param endpoint: endpoint name, e.g. discovery, jwks, token, userinfo
+        :return: timeout in seconds
+        """
+        if endpoint in self.__timeouts:
+            return float(self.__timeouts[endpoint])
+        return float(self.__timeouts["default"])
+
+    def get_circuit_failure_threshold(self) -> int:
+        return self.__circuit_failure_threshold
+
+    def get_circuit_reset_timeout(self) -> float:
+        return self.__circuit_reset_timeout
+
+    def get_retry_attempts(self) -> int:
+        return self.__retry_attempts
+
+    def get_retry_backoff(self) -> float:
+        return self.__retry_backoff
+
+    def get_hedge_delay(self) -> float:
+        return self.__hedge_delay
+
     def dynamic_registration_enabled(self) -> bool:
         return self.__dynamic_registration
 
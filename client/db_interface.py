@@ -1,4 +1,4 @@
-from typing import Tuple, Union
+from typing import Tuple, Union, Iterable, Iterator
 from abc import ABC, abstractclassmethod
 from client.session import Session
 from client.user import User
@@ -14,7 +14,7 @@ class OAuth2Db(ABC):
         pass
 
     @abstractclassmethod
-    def save_session(self, session: Session, user: User) -> None:
+    def save_session(self, session: Session, user: User, save_user: bool=True) -> None:
         pass
 
     @abstractclassmethod
@@ -24,3 +24,39 @@ class OAuth2Db(ABC):
     @abstractclassmethod
     def save_dynamic_registration(self, client_name: str, configuration: dict) -> None:
         pass
+
+    @abstractclassmethod
+    def save_pending_authorization(self, state: str, detail: str, expires_at: float, now: float, capacity: int) -> None:
+        pass
+
+    @abstractclassmethod
+    def take_pending_authorization(self, state: str, now: float) -> Union[str, None]:
+        pass
+
+    @abstractclassmethod
+    def take_rate_limit_tokens(self, key: str, rate: float, burst: int, cost: int, now: float) -> bool:
+        pass
+
+    @abstractclassmethod
+    def prune_rate_limit(self, key_prefix: str, idle_before: float) -> None:
+        pass
+
+    @abstractclassmethod
+    def iter_users(self, chunk_size: int=1000) -> Iterator[User]:
+        pass
+
+    @abstractclassmethod
+    def iter_sessions(self, chunk_size: int=1000) -> Iterator[Session]:
+        pass
+
+    @abstractclassmethod
+    def save_users(self, users: Iterable[User]) -> None:
+        pass
+
+    @abstractclassmethod
+    def save_sessions(self, sessions: Iterable[Session]) -> None:
+        pass
+
+    @abstractclassmethod
+    def compact(self) -> None:
+        pass
@@ -0,0 +1,127 @@
+import hashlib
+from time import time
+from threading import Lock
+from collections import OrderedDict
+from typing import List, Union
+from client.client import Client
+from client.config import Config
+from client.metrics import metrics
+from client.validator import JwtValidator, JwtValidatorException
+
+
+class IntrospectionCache(object):
+    """
+    Introspection results keyed by SHA-256 of the token, so raw tokens are not kept in memory
+    """
+    def __init__(self, max_entries: int=10000) -> None:
+        self.__max_entries: int = max_entries
+        self.__lock: Lock = Lock()
+        self.__entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, now: float) -> Union[dict, None]:
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self.__entries[key]
+                return None
+            self.__entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, result: dict, expires_at: float) -> None:
+        with self.__lock:
+            self.__entries[key] = (expires_at, result)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__max_entries:
+                self.__entries.popitem(last=False)
+
+
+class TokenIntrospector(object):
+    def __init__(self, config: Config, client: Client, jwt_validator: JwtValidator) -> None:
+        self.__config: Config = config
+        self.__client: Client = client
+        self.__jwt_validator: JwtValidator = jwt_validator
+        self.__cache: IntrospectionCache = IntrospectionCache(config.get_introspection_cache_size())
+        if 0 < len(config.get_introspection_clients()):
+            self.__check_audience()
+
+    def __check_audience(self) -> None:
+        audience = self.__config.get_introspection_audience()
+        if 0 == len(audience):
+            raise Exception('introspection_audience not set.')
+        if audience == self.__config.get_client_id():
+            # ID tokens of this app have client_id as audience and would be accepted as access tokens
+            raise Exception('introspection_audience must differ from client_id.')
+
+    def __validate_jwt(self, token: str, now: float) -> dict:
+        """
+        Invalid tokens are inactive, errors of JWKS fetch are raised, so they are not cached
+        """
+        self.__check_audience()
+        try:
+            claims = self.__jwt_validator.validate(
+                token, self.__config.get_issuer(), self.__config.get_introspection_audience()
+            )
+        except JwtValidatorException as e:
+            print("Token is not active: " + str(e))
+            return {"active": False}
+        if "exp" in claims and int(claims["exp"]) <= now:
+            return {"active": False}
+        if "nbf" in claims and int(claims["nbf"]) > now:
+            return {"active": False}
+        result = dict(claims)
+        result["active"] = True
+        return result
+
+    def __expires_at(self, result: dict, now: float, is_jwt: bool) -> float:
+        ttl_expiration = now + self.__config.get_introspection_cache_ttl()
+        if not result.get("active", False) or "exp" not in result:
+            return ttl_expiration
+        if is_jwt:
+            # signed claims can not change before exp
+            return float(result["exp"])
+        return min(float(result["exp"]), ttl_expiration)
+
+    def introspect(self, token: str) -> dict:
+        """
+        Validate JWT locally, opaque tokens are sent to the introspection endpoint of the provider
+        :param token: access token
+        :return: RFC 7662 introspection response
+        :raises CircuitOpenException: when JWKS or introspection endpoint is degraded, errors are not cached
+        """
+        now = time()
+        key = IntrospectionCache.key(token)
+        result = self.__cache.get(key, now)
+        if result is not None:
+            metrics.increment("introspection.cache_hit")
+            return result
+
+        metrics.increment("introspection.cache_miss")
+        is_jwt = 3 == len(token.split('.'))
+        if is_jwt:
+            result = self.__validate_jwt(token, now)
+        elif 0 < len(self.__config.get_introspection_endpoint()):
+            result = self.__client.introspect(token)
+        else:
+            result = {"active": False}
+        self.__cache.put(key, result, self.__expires_at(result, now, is_jwt))
+        return result
+
+    def introspect_many(self, tokens: List[str]) -> List[dict]:
+        """
+        :param tokens: access tokens, duplicates are introspected once
+        :return: introspection responses in order of tokens
+        """
+        results = {}
+        for token in tokens:
+            if token not in results:
+                results[token] = self.introspect(token)
+        return [results[token] for token in tokens]
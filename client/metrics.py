@@ -0,0 +1,23 @@
+from threading import Lock
+from typing import Dict
+
+
+class Metrics(object):
+    def __init__(self) -> None:
+        self.__lock: Lock = Lock()
+        self.__counters: Dict[str, int] = {}
+
+    def increment(self, name: str, value: int=1) -> None:
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def get(self, name: str) -> int:
+        with self.__lock:
+            return self.__counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.__lock:
+            return dict(self.__counters)
+
+
+metrics = Metrics()
@@ -0,0 +1,99 @@
+from time import monotonic, time
+from threading import Lock
+from collections import OrderedDict
+from typing import Union
+from client.config import Config
+from client.db_interface import OAuth2Db
+from client.metrics import metrics
+
+
+class RateLimitExceededException(Exception):
+    pass
+
+
+class TokenBucketLimiter(object):
+    """
+    In-process token buckets. Buckets are kept in LRU order, so keys idle long enough to be refilled
+    are dropped from the front and the table never exceeds max_keys.
+    """
+    def __init__(self, name: str, rate: float, burst: int, max_keys: int=10000) -> None:
+        """
+        :param name: limiter name used in metrics
+        :param rate: tokens added per second
+        :param burst: bucket capacity
+        :param max_keys: maximum number of tracked keys
+        """
+        self.__name: str = name
+        self.__rate: float = rate
+        self.__burst: int = burst
+        self.__max_keys: int = max_keys
+        self.__idle_after: float = burst / rate if 0 < rate else float("inf")
+        self.__lock: Lock = Lock()
+        self.__buckets: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__buckets)
+
+    def __evict(self, now: float) -> None:
+        while self.__buckets:
+            key, (_, updated) = next(iter(self.__buckets.items()))
+            if now - updated < self.__idle_after and len(self.__buckets) < self.__max_keys:
+                break
+            del self.__buckets[key]
+
+    def allow(self, key: str, cost: int=1) -> bool:
+        now = monotonic()
+        with self.__lock:
+            bucket = self.__buckets.pop(key, None)
+            if bucket is None:
+                self.__evict(now)
+                tokens = float(self.__burst)
+            else:
+                tokens = min(float(self.__burst), bucket[0] + (now - bucket[1]) * self.__rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.__buckets[key] = (tokens, now)
+
+        if not allowed:
+            metrics.increment("rate_limit.%s.rejected" % self.__name)
+        return allowed
+
+
+class DbTokenBucketLimiter(object):
+    """
+    Token buckets stored through OAuth2Db, shared by all nodes using the same database.
+    Bucket idle for burst / rate seconds is full again, so its row is deleted at most once per that interval.
+    """
+    def __init__(self, name: str, rate: float, burst: int, db: OAuth2Db) -> None:
+        self.__name: str = name
+        self.__rate: float = rate
+        self.__burst: int = burst
+        self.__db: OAuth2Db = db
+        self.__idle_timeout: float = max(1.0, burst / rate)
+        self.__pruned_at: float = time()
+
+    def allow(self, key: str, cost: int=1) -> bool:
+        now = time()
+        if now - self.__pruned_at >= self.__idle_timeout:
+            self.__pruned_at = now
+            self.__db.prune_rate_limit(self.__name + ":", now - self.__idle_timeout)
+        allowed = self.__db.take_rate_limit_tokens(
+            self.__name + ":" + key, self.__rate, self.__burst, cost, now
+        )
+        if not allowed:
+            metrics.increment("rate_limit.%s.rejected" % self.__name)
+        return allowed
+
+
+def create_limiter(name: str, config: Config, db: OAuth2Db=None) -> Union[TokenBucketLimiter, DbTokenBucketLimiter, None]:
+    """
+    :param name: rate limit name from configuration, e.g. index, callback, outbound
+    :return: limiter or None when rate limit is not configured
+    """
+    limit = config.get_rate_limit(name)
+    if limit is None:
+        return None
+    if "db" == config.get_rate_limit_backend() and db is not None:
+        return DbTokenBucketLimiter(name, limit[0], limit[1], db)
+    return TokenBucketLimiter(name, limit[0], limit[1], config.get_rate_limit_max_keys())
@@ -0,0 +1,194 @@
+import random
+from time import monotonic, sleep
+from threading import Lock
+from socket import timeout as SocketTimeout
+from ssl import SSLContext
+from urllib.request import Request
+from urllib.error import URLError, HTTPError
+from typing import Dict
+from client.config import Config
+from client.metrics import metrics
+from client.rate_limit import RateLimitExceededException
+from client.tls import tls_manager
+from client.tracing import tracer
+
+
+class CircuitOpenException(Exception):
+    pass
+
+
+class CircuitBreaker(object):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int=5, reset_timeout: float=30.0) -> None:
+        """
+        :param name: endpoint name used in metrics
+        :param failure_threshold: consecutive failures which open the circuit
+        :param reset_timeout: seconds after which one trial call is let through
+        """
+        self.__name: str = name
+        self.__failure_threshold: int = failure_threshold
+        self.__reset_timeout: float = reset_timeout
+        self.__lock: Lock = Lock()
+        self.__state: str = CircuitBreaker.CLOSED
+        self.__failures: int = 0
+        self.__opened_at: float = 0.0
+        self.__trial_running: bool = False
+
+    def get_state(self) -> str:
+        return self.__state
+
+    def __transition(self, state: str) -> None:
+        if self.__state != state:
+            self.__state = state
+            metrics.increment("circuit.%s.%s" % (self.__name, state))
+            print("Circuit for %s is %s" % (self.__name, state))
+
+    def before_call(self) -> None:
+        """
+        :raises CircuitOpenException: when calls to endpoint should fail fast
+        """
+        with self.__lock:
+            if CircuitBreaker.OPEN == self.__state:
+                if monotonic() - self.__opened_at < self.__reset_timeout:
+                    metrics.increment("circuit.%s.rejected" % self.__name)
+                    raise CircuitOpenException("Circuit for %s is open" % self.__name)
+                self.__transition(CircuitBreaker.HALF_OPEN)
+            if CircuitBreaker.HALF_OPEN == self.__state:
+                if self.__trial_running:
+                    metrics.increment("circuit.%s.rejected" % self.__name)
+                    raise CircuitOpenException("Circuit for %s is half open" % self.__name)
+                self.__trial_running = True
+
+    def on_success(self) -> None:
+        with self.__lock:
+            self.__failures = 0
+            self.__trial_running = False
+            self.__transition(CircuitBreaker.CLOSED)
+
+    def on_failure(self) -> None:
+        with self.__lock:
+            self.__failures += 1
+            self.__trial_running = False
+            if CircuitBreaker.HALF_OPEN == self.__state or self.__failures >= self.__failure_threshold:
+                self.__opened_at = monotonic()
+                self.__transition(CircuitBreaker.OPEN)
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Server errors, timeouts and connection errors are worth retrying, client errors are not
+    """
+    if isinstance(error, HTTPError):
+        return 500 <= error.code
+    return isinstance(error, (URLError, SocketTimeout, ConnectionError))
+
+
+class ResilientOpener(object):
+    def __init__(self, config: Config, limiter=None) -> None:
+        """
+        :param config: configuration
+        :param limiter: optional rate limiter of outbound calls, keyed by client id and endpoint
+        """
+        self.__config: Config = config
+        self.__limiter = limiter
+        self.__lock: Lock = Lock()
+        self.__breakers: Dict[str, CircuitBreaker] = {}
+        self.__executor = None
+
+    def get_breaker(self, endpoint: str) -> CircuitBreaker:
+        with self.__lock:
+            if endpoint not in self.__breakers:
+                self.__breakers[endpoint] = CircuitBreaker(
+                    endpoint,
+                    self.__config.get_circuit_failure_threshold(),
+                    self.__config.get_circuit_reset_timeout()
+                )
+            return self.__breakers[endpoint]
+
+    def __call(self, endpoint: str, request: Request, context: SSLContext) -> bytes:
+        breaker = self.get_breaker(endpoint)
+        breaker.before_call()
+        with tracer.span("http." + endpoint, method=request.get_method()) as span:
+            traceparent = span.get_traceparent()
+            if traceparent is not None:
+                request.add_header("traceparent", traceparent)
+            try:
+                timeout = self.__config.get_timeout(endpoint)
+                with tls_manager.urlopen(request, context=context, timeout=timeout) as response:
+                    body = response.read()
+                    span.set_attribute("status", response.status)
+            except Exception as e:
+                if is_transient(e):
+                    metrics.increment("http.%s.failure" % endpoint)
+                    breaker.on_failure()
+                else:
+                    breaker.on_success()
+                raise e
+        breaker.on_success()
+        return body
+
+    def __call_with_retries(self, endpoint: str, request: Request, context: SSLContext) -> bytes:
+        attempts = self.__config.get_retry_attempts()
+        backoff = self.__config.get_retry_backoff()
+        for attempt in range(1, attempts + 1):
+            try:
+                return self.__call(endpoint, request, context)
+            except CircuitOpenException as e:
+                raise e
+            except Exception as e:
+                if attempt == attempts or not is_transient(e):
+                    raise e
+                metrics.increment("http.%s.retry" % endpoint)
+                # full jitter exponential backoff
+                sleep(random.uniform(0, backoff * (2 ** (attempt - 1))))
+
+    def __call_hedged(self, endpoint: str, request: Request, context: SSLContext, delay: float) -> bytes:
+        # concurrent.futures pulls in logging, so it is imported only when hedging is used
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        from contextvars import copy_context
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hedge")
+        # hedged calls run in copies of the caller's context to stay in the current trace
+        pending = {self.__executor.submit(copy_context().run, self.__call_with_retries, endpoint, request, context)}
+        done, pending = wait(pending, timeout=delay)
+        if 0 == len(done):
+            metrics.increment("http.%s.hedge" % endpoint)
+            pending.add(
+                self.__executor.submit(copy_context().run, self.__call_with_retries, endpoint, request, context)
+            )
+
+        error = None
+        while done or pending:
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        raise error
+
+    def open(self, endpoint: str, request: Request, context: SSLContext=None,
+             idempotent: bool=False, hedge: bool=False) -> bytes:
+        """
+        :param endpoint: endpoint name, selects timeout and circuit breaker
+        :param request: request to send
+        :param context: ssl context
+        :param idempotent: request may be retried
+        :param hedge: send second request when the first one is slower than configured hedge delay
+        :return: response body
+        :raises CircuitOpenException: when endpoint is degraded
+        :raises RateLimitExceededException: when outbound rate limit is exceeded
+        """
+        if self.__limiter is not None and \
+                not self.__limiter.allow(self.__config.get_client_id() + ":" + endpoint):
+            raise RateLimitExceededException("Rate limit of %s calls exceeded" % endpoint)
+        if hedge and idempotent and 0 < self.__config.get_hedge_delay():
+            return self.__call_hedged(endpoint, request, context, self.__config.get_hedge_delay())
+        if idempotent:
+            return self.__call_with_retries(endpoint, request, context)
+        return self.__call(endpoint, request, context)
@@ -1,5 +1,7 @@
 from client.db_object import BaseDbObject
-from client.utils import dict_key_to_camel_case, generate_random_string
+from time import time
+from typing import Union
+from client.utils import dict_key_to_camel_case, generate_random_string, decode_jwt_payload
 
 
 class Session(BaseDbObject):
@@ -49,3 +51,20 @@ class Session(BaseDbObject):
 
     def get_user_sub(self) -> str:
         return self.__user_sub
+
+    def get_expiration(self) -> Union[int, None]:
+        """
+        :return: exp claim of id token, None when session has no expiration
+        """
+        if self.__id_token is None:
+            return None
+        claims = decode_jwt_payload(self.__id_token)
+        if claims is None or "exp" not in claims:
+            return None
+        return int(claims["exp"])
+
+    def is_expired(self, now: int=None) -> bool:
+        expiration = self.get_expiration()
+        if expiration is None:
+            return False
+        return expiration <= (int(time()) if now is None else now)
@@ -0,0 +1,169 @@
+import json
+import base64
+import hashlib
+import secrets
+from math import ceil
+from time import time, monotonic
+from threading import Lock
+from collections import OrderedDict
+from typing import Union
+from client.config import Config
+from client.db_interface import OAuth2Db
+from client.db_object import BaseDbObject
+from client.metrics import metrics
+from client.utils import dict_key_to_camel_case
+
+
+class PendingAuthorization(BaseDbObject):
+    def __init__(self, detail: dict=None, browser_id: str="", return_url: str="/") -> None:
+        """
+        :param browser_id: random id kept in Flask session of the browser which started the login
+        """
+        if detail is None:
+            self.__state: str = secrets.token_urlsafe(24)
+            self.__nonce: str = secrets.token_urlsafe(24)
+            self.__code_verifier: str = secrets.token_urlsafe(48)
+            self.__browser_id: str = browser_id
+            self.__return_url: str = return_url
+        else:
+            self.__state = detail[dict_key_to_camel_case("__state")]
+            self.__nonce = detail[dict_key_to_camel_case("__nonce")]
+            self.__code_verifier = detail[dict_key_to_camel_case("__code_verifier")]
+            self.__browser_id = detail.get(dict_key_to_camel_case("__browser_id"), "")
+            self.__return_url = detail[dict_key_to_camel_case("__return_url")]
+
+    def get_state(self) -> str:
+        return self.__state
+
+    def is_started_by(self, browser_id: Union[str, None]) -> bool:
+        """
+        :return: True when callback comes from the browser which started the login, state alone does not
+            protect against login CSRF since anyone can obtain valid state by starting a login
+        """
+        return bool(browser_id) and bool(self.__browser_id) and secrets.compare_digest(self.__browser_id, browser_id)
+
+    def get_nonce(self) -> str:
+        return self.__nonce
+
+    def get_code_verifier(self) -> str:
+        return self.__code_verifier
+
+    def get_code_challenge(self) -> str:
+        """
+        :return: PKCE S256 code challenge
+        """
+        digest = hashlib.sha256(self.__code_verifier.encode("ascii")).digest()
+        return base64.urlsafe_b64encode(digest).decode("ascii").rstrip("=")
+
+    def get_return_url(self) -> str:
+        return self.__return_url
+
+
+def check_browser(pending: Union[PendingAuthorization, None], browser_id: Union[str, None]) \
+        -> Union[PendingAuthorization, None]:
+    """
+    :return: pending authorization when it was started by given browser, mismatched state is consumed anyway
+    """
+    if pending is None:
+        return None
+    if not pending.is_started_by(browser_id):
+        metrics.increment("pending_authorization.browser_mismatch")
+        return None
+    return pending
+
+
+class PendingAuthorizationStore(object):
+    """
+    In-process pending authorizations. Expiry uses time wheel with one slot per resolution tick,
+    so cleanup touches only expired entries. When capacity is reached the oldest entry is dropped.
+    """
+    def __init__(self, ttl: float=300.0, capacity: int=10000, resolution: float=1.0) -> None:
+        self.__resolution: float = resolution
+        self.__ttl_ticks: int = max(1, int(ceil(ttl / resolution)))
+        self.__capacity: int = capacity
+        self.__lock: Lock = Lock()
+        self.__entries: OrderedDict = OrderedDict()
+        self.__wheel: list = [set() for _ in range(self.__ttl_ticks + 1)]
+        self.__tick: int = self.__now_tick()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __now_tick(self) -> int:
+        return int(monotonic() / self.__resolution)
+
+    def __advance(self, now_tick: int) -> None:
+        steps = min(now_tick - self.__tick, len(self.__wheel))
+        for step in range(1, steps + 1):
+            slot = self.__wheel[(self.__tick + step) % len(self.__wheel)]
+            if slot:
+                for state in slot:
+                    self.__entries.pop(state, None)
+                metrics.increment("pending_authorization.expired", len(slot))
+                slot.clear()
+        self.__tick = max(self.__tick, now_tick)
+
+    def __remove(self, state: str) -> Union[PendingAuthorization, None]:
+        entry = self.__entries.pop(state, None)
+        if entry is None:
+            return None
+        self.__wheel[entry[1] % len(self.__wheel)].discard(state)
+        return entry[0]
+
+    def create(self, browser_id: str, return_url: str="/") -> PendingAuthorization:
+        pending = PendingAuthorization(browser_id=browser_id, return_url=return_url)
+        with self.__lock:
+            self.__advance(self.__now_tick())
+            while len(self.__entries) >= self.__capacity:
+                self.__remove(next(iter(self.__entries)))
+                metrics.increment("pending_authorization.evicted")
+            expires_tick = self.__tick + self.__ttl_ticks
+            self.__entries[pending.get_state()] = (pending, expires_tick)
+            self.__wheel[expires_tick % len(self.__wheel)].add(pending.get_state())
+        return pending
+
+    def take(self, state: str, browser_id: Union[str, None]) -> Union[PendingAuthorization, None]:
+        """
+        :return: pending authorization started by the same browser, every state can be taken only once
+        """
+        with self.__lock:
+            self.__advance(self.__now_tick())
+            pending = self.__remove(state)
+        return check_browser(pending, browser_id)
+
+
+class DbPendingAuthorizationStore(object):
+    """
+    Pending authorizations stored through OAuth2Db, shared by all workers and nodes using the same database
+    """
+    def __init__(self, db: OAuth2Db, ttl: float=300.0, capacity: int=10000) -> None:
+        self.__db: OAuth2Db = db
+        self.__ttl: float = ttl
+        self.__capacity: int = capacity
+
+    def create(self, browser_id: str, return_url: str="/") -> PendingAuthorization:
+        pending = PendingAuthorization(browser_id=browser_id, return_url=return_url)
+        now = time()
+        self.__db.save_pending_authorization(pending.get_state(), str(pending), now + self.__ttl, now, self.__capacity)
+        return pending
+
+    def take(self, state: str, browser_id: Union[str, None]) -> Union[PendingAuthorization, None]:
+        detail = self.__db.take_pending_authorization(state, time())
+        if detail is None:
+            return None
+        return check_browser(PendingAuthorization(detail=json.loads(detail)), browser_id)
+
+
+def create_state_store(config: Config, db: OAuth2Db=None, multi_process: bool=False) \
+        -> Union[PendingAuthorizationStore, DbPendingAuthorizationStore]:
+    """
+    :param multi_process: app runs in more worker processes, callback may reach other worker than login,
+        so pending authorizations are always stored in db
+    """
+    if db is not None and (multi_process or "db" == config.get_pending_authorization_backend()):
+        return DbPendingAuthorizationStore(
+            db, config.get_pending_authorization_ttl(), config.get_pending_authorization_capacity()
+        )
+    return PendingAuthorizationStore(
+        config.get_pending_authorization_ttl(), config.get_pending_authorization_capacity()
+    )
@@ -0,0 +1,119 @@
+import hashlib
+from ssl import SSLContext, SSLError, SSLSocket
+from threading import Lock
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.request import Request, HTTPSHandler, OpenerDirector, build_opener, urlopen
+from typing import Dict, List, Tuple
+from client.config import Config
+from client.metrics import metrics
+from client.utils import get_ssl_context
+
+
+class CertificatePinningException(SSLError):
+    pass
+
+
+class TlsContextManager(object):
+    """
+    Process-wide ssl contexts. Trust stores are loaded once per configuration and TLS sessions are kept
+    per host, so repeated connections to the same provider use abbreviated handshake.
+    """
+    def __init__(self) -> None:
+        self.__lock: Lock = Lock()
+        self.__contexts: Dict[tuple, SSLContext] = {}
+        self.__openers: Dict[int, OpenerDirector] = {}
+        self.__sessions: Dict[Tuple[int, str, int], object] = {}
+
+    def get_context(self, config: Config) -> SSLContext:
+        key = (config.verify_ssl_server(), config.get_ca_bundle(), tuple(config.get_pinned_certificates()))
+        with self.__lock:
+            if key not in self.__contexts:
+                ctx = get_ssl_context(config)
+                self.__contexts[key] = ctx
+                self.__openers[id(ctx)] = build_opener(
+                    ResumingHTTPSHandler(self, ctx, config.get_pinned_certificates())
+                )
+            return self.__contexts[key]
+
+    def urlopen(self, request: Request, context: SSLContext=None, timeout: float=None):
+        opener = None if context is None else self.__openers.get(id(context))
+        if opener is None:
+            return urlopen(request, context=context, timeout=timeout)
+        return opener.open(request, timeout=timeout)
+
+    def get_session(self, context: SSLContext, host: str, port: int):
+        with self.__lock:
+            return self.__sessions.get((id(context), host, port))
+
+    def save_session(self, context: SSLContext, host: str, port: int, sock: SSLSocket) -> None:
+        if sock.session is not None:
+            with self.__lock:
+                self.__sessions[(id(context), host, port)] = sock.session
+
+    @staticmethod
+    def on_handshake(sock: SSLSocket) -> None:
+        if sock.session_reused:
+            metrics.increment("tls.resumed_handshake")
+        else:
+            metrics.increment("tls.full_handshake")
+
+    @staticmethod
+    def get_counters() -> Dict[str, int]:
+        return {
+            "full_handshakes": metrics.get("tls.full_handshake"),
+            "resumed_handshakes": metrics.get("tls.resumed_handshake")
+        }
+
+
+class ResumingHTTPSConnection(HTTPSConnection):
+    def __init__(self, host, manager: TlsContextManager=None, pins: List[str]=None, **kwargs) -> None:
+        super().__init__(host, **kwargs)
+        self.__manager: TlsContextManager = manager
+        self.__pins: List[str] = [] if pins is None else pins
+
+    def __server_hostname(self) -> str:
+        return self._tunnel_host if self._tunnel_host else self.host
+
+    def connect(self) -> None:
+        HTTPConnection.connect(self)
+        server_hostname = self.__server_hostname()
+        self.sock = self._context.wrap_socket(
+            self.sock,
+            server_hostname=server_hostname,
+            session=self.__manager.get_session(self._context, server_hostname, self.port)
+        )
+        TlsContextManager.on_handshake(self.sock)
+        if self.__pins and not self.sock.session_reused:
+            fingerprint = hashlib.sha256(self.sock.getpeercert(binary_form=True)).hexdigest()
+            if fingerprint not in self.__pins:
+                self.sock.close()
+                raise CertificatePinningException("Certificate of %s is not pinned" % server_hostname)
+        self.__manager.save_session(self._context, server_hostname, self.port, self.sock)
+
+    def getresponse(self):
+        # TLS 1.3 session tickets arrive after handshake and are processed while response headers are read,
+        # socket is kept here since getresponse closes connection for responses without keep-alive
+        sock = self.sock
+        response = super().getresponse()
+        if isinstance(sock, SSLSocket):
+            self.__manager.save_session(self._context, self.__server_hostname(), self.port, sock)
+        return response
+
+
+class ResumingHTTPSHandler(HTTPSHandler):
+    def __init__(self, manager: TlsContextManager, context: SSLContext, pins: List[str]) -> None:
+        super().__init__(context=context)
+        self.__manager: TlsContextManager = manager
+        self.__context: SSLContext = context
+        self.__pins: List[str] = [pin.replace(":", "").lower() for pin in pins]
+
+    def __connection(self, host, **kwargs) -> ResumingHTTPSConnection:
+        return ResumingHTTPSConnection(
+            host, manager=self.__manager, pins=self.__pins, context=self.__context, **kwargs
+        )
+
+    def https_open(self, req):
+        return self.do_open(self.__connection, req)
+
+
+tls_manager = TlsContextManager()
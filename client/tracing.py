@@ -0,0 +1,226 @@
+import os
+import json
+import random
+import functools
+from time import time, perf_counter
+from threading import Lock
+from collections import deque
+from contextvars import ContextVar
+from typing import List, Union
+from client.config import Config
+
+_current_span: ContextVar = ContextVar("current_span", default=None)
+
+
+class Span(object):
+    def __init__(self, name: str, trace_id: str, parent_id: Union[str, None], attributes: dict) -> None:
+        self.__name: str = name
+        self.__trace_id: str = trace_id
+        self.__span_id: str = "%016x" % random.getrandbits(64)
+        self.__parent_id: Union[str, None] = parent_id
+        self.__attributes: dict = attributes
+        self.__start: float = time()
+        self.__duration: float = 0.0
+        self.__error: Union[str, None] = None
+
+    def get_trace_id(self) -> str:
+        return self.__trace_id
+
+    def get_span_id(self) -> str:
+        return self.__span_id
+
+    def set_attribute(self, key: str, value) -> None:
+        self.__attributes[key] = value
+
+    def set_duration(self, duration: float) -> None:
+        self.__duration = duration
+
+    def set_error(self, error: str) -> None:
+        self.__error = error
+
+    def get_traceparent(self) -> str:
+        """
+        :return: W3C traceparent header value
+        """
+        return "00-%s-%s-01" % (self.__trace_id, self.__span_id)
+
+    def to_dict(self) -> dict:
+        return {
+            "traceId": self.__trace_id,
+            "spanId": self.__span_id,
+            "parentId": self.__parent_id,
+            "name": self.__name,
+            "start": self.__start,
+            "durationMs": round(self.__duration * 1000, 3),
+            "attributes": self.__attributes,
+            "error": self.__error
+        }
+
+
+class NoopSpan(object):
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    @staticmethod
+    def get_traceparent() -> None:
+        return None
+
+
+class NoopSpanContext(object):
+    def __enter__(self) -> NoopSpan:
+        return NOOP_SPAN
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+NOOP_SPAN_CONTEXT = NoopSpanContext()
+
+
+class UnsampledSpanContext(object):
+    """
+    Root span of request which is not sampled, marks the context so child spans do not sample again
+    """
+    def __init__(self) -> None:
+        self.__token = None
+
+    def __enter__(self) -> NoopSpan:
+        self.__token = _current_span.set(NOOP_SPAN)
+        return NOOP_SPAN
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        _current_span.reset(self.__token)
+
+
+class SpanContext(object):
+    def __init__(self, tracer: 'Tracer', span: Span) -> None:
+        self.__tracer: Tracer = tracer
+        self.__span: Span = span
+        self.__token = None
+        self.__started: float = 0.0
+
+    def __enter__(self) -> Span:
+        self.__token = _current_span.set(self.__span)
+        self.__started = perf_counter()
+        return self.__span
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.__span.set_duration(perf_counter() - self.__started)
+        if exc_type is not None:
+            self.__span.set_error(exc_type.__name__ + ": " + str(exc_value))
+        _current_span.reset(self.__token)
+        self.__tracer.export(self.__span)
+
+
+class RingBufferExporter(object):
+    def __init__(self, capacity: int=1000) -> None:
+        self.__spans: deque = deque(maxlen=capacity)
+
+    def export(self, span: dict) -> None:
+        self.__spans.append(span)
+
+    def get_spans(self, trace_id: str=None) -> List[dict]:
+        spans = list(self.__spans)
+        if trace_id is None:
+            return spans
+        return [span for span in spans if trace_id == span["traceId"]]
+
+
+class FileExporter(object):
+    """
+    Appends spans as NDJSON, file is reopened after fork so every worker has its own handle
+    """
+    def __init__(self, path: str) -> None:
+        self.__path: str = path
+        self.__lock: Lock = Lock()
+        self.__fp = None
+        self.__pid: int = 0
+
+    def export(self, span: dict) -> None:
+        line = json.dumps(span) + "\n"
+        with self.__lock:
+            if self.__fp is None or os.getpid() != self.__pid:
+                self.__fp = open(self.__path, "a", buffering=1)
+                self.__pid = os.getpid()
+            self.__fp.write(line)
+
+
+class Tracer(object):
+    def __init__(self) -> None:
+        self.__sample_rate: float = 0.0
+        self.__exporter = None
+        self.__trust_traceparent: bool = False
+
+    def configure(self, sample_rate: float, exporter, trust_traceparent: bool=False) -> None:
+        """
+        :param sample_rate: probability of tracing request
+        :param exporter: RingBufferExporter, FileExporter or None to disable tracing
+        :param trust_traceparent: also trace requests with sampled flag in incoming traceparent
+        """
+        self.__sample_rate = sample_rate
+        self.__exporter = exporter
+        self.__trust_traceparent = trust_traceparent
+
+    def get_exporter(self):
+        return self.__exporter
+
+    def span(self, name: str, traceparent: str=None, **attributes) \
+            -> Union[SpanContext, NoopSpanContext, UnsampledSpanContext]:
+        """
+        :param name: span name
+        :param traceparent: incoming W3C traceparent header, used only for root span
+        :return: context manager of child span of the current span, new trace is sampled for root span
+        """
+        parent = _current_span.get()
+        if parent is NOOP_SPAN:
+            return NOOP_SPAN_CONTEXT
+        if parent is not None:
+            return SpanContext(self, Span(name, parent.get_trace_id(), parent.get_span_id(), attributes))
+        if self.__exporter is None:
+            return NOOP_SPAN_CONTEXT
+
+        trace_id, parent_id, sampled = None, None, random.random() < self.__sample_rate
+        parts = [] if traceparent is None else traceparent.split("-")
+        if 4 == len(parts) and 32 == len(parts[1]) and 16 == len(parts[2]):
+            trace_id, parent_id = parts[1], parts[2]
+            sampled = sampled or (self.__trust_traceparent and "01" == parts[3])
+        if not sampled:
+            return UnsampledSpanContext()
+        if trace_id is None:
+            trace_id = "%032x" % random.getrandbits(128)
+        return SpanContext(self, Span(name, trace_id, parent_id, attributes))
+
+    def export(self, span: Span) -> None:
+        if self.__exporter is not None:
+            self.__exporter.export(span.to_dict())
+
+    @staticmethod
+    def get_current_span() -> Union[Span, NoopSpan]:
+        span = _current_span.get()
+        return NOOP_SPAN if span is None else span
+
+
+tracer = Tracer()
+
+
+def traced(name: str):
+    """
+    Run decorated function in a span, when no trace is sampled only a context variable lookup is added
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def configure_tracing(config: Config) -> None:
+    exporter = None
+    if "memory" == config.get_tracing_exporter():
+        exporter = RingBufferExporter(config.get_tracing_buffer_size())
+    elif "file" == config.get_tracing_exporter():
+        exporter = FileExporter(config.get_tracing_file())
+    tracer.configure(config.get_tracing_sample_rate(), exporter, config.tracing_traceparent_trusted())
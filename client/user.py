@@ -1,10 +1,23 @@
 from client.db_object import BaseDbObject
 
+# id token claims which describe the token or the login rather than the user and change on every login
+PROTOCOL_CLAIMS = frozenset((
+    "iss", "aud", "exp", "iat", "nbf", "jti", "nonce", "at_hash", "c_hash", "auth_time", "acr", "amr", "azp", "sid"
+))
 
 class User(BaseDbObject):
-    def __init__(self, email: str=None, sub: str=None) -> None:
+    def __init__(self, email: str=None, sub: str=None, claims: dict=None) -> None:
         self.__email: str = email
         self.__sub: str = sub
+        self.__claims: dict = {} if claims is None else claims
+
+    @staticmethod
+    def from_claims(claims: dict) -> 'User':
+        """
+        :param claims: userinfo response or id token claims, protocol claims are not part of the profile
+        """
+        profile = {name: value for name, value in claims.items() if name not in PROTOCOL_CLAIMS}
+        return User(email=claims.get("email"), sub=claims["sub"], claims=profile)
 
     def set_email(self, email: str) -> None:
         self.__email = email
@@ -12,8 +25,21 @@ class User(BaseDbObject):
     def set_sub(self, sub: str) -> None:
         self.__sub = sub
 
+    def set_claims(self, claims: dict) -> None:
+        self.__claims = claims
+
     def get_email(self) -> str:
         return self.__email
 
     def get_sub(self) -> str:
         return self.__sub
+
+    def get_claims(self) -> dict:
+        return self.__claims
+
+    def get_claim(self, name: str, default=None):
+        return self.__claims.get(name, default)
+
+    def is_same_profile(self, other: 'User') -> bool:
+        return other is not None and self.__sub == other.get_sub() and self.__email == other.get_email() \
+            and self.__claims == other.get_claims()
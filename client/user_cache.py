@@ -0,0 +1,56 @@
+from time import monotonic
+from threading import Lock
+from collections import OrderedDict
+from typing import Union
+from client.metrics import metrics
+from client.user import User
+
+
+class UserProfileCache(object):
+    """
+    Recently seen user profiles keyed by sub. Fresh profiles replace userinfo call, stale ones are kept
+    to detect unchanged profiles which need not be saved again.
+    """
+    def __init__(self, ttl: float=300.0, max_entries: int=10000) -> None:
+        """
+        :param ttl: seconds for which profile is fresh, 0 disables userinfo skipping
+        :param max_entries: maximum number of cached profiles
+        """
+        self.__ttl: float = ttl
+        self.__max_entries: int = max_entries
+        self.__lock: Lock = Lock()
+        self.__entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get_fresh(self, sub: str) -> Union[User, None]:
+        with self.__lock:
+            entry = self.__entries.get(sub)
+            if entry is None or monotonic() - entry[0] >= self.__ttl:
+                metrics.increment("user_profile.cache_miss")
+                return None
+            self.__entries.move_to_end(sub)
+        metrics.increment("user_profile.cache_hit")
+        return entry[1]
+
+    def is_changed(self, user: User) -> bool:
+        """
+        :return: True when profile differs from the cached one and has to be saved
+        """
+        with self.__lock:
+            entry = self.__entries.get(user.get_sub())
+            changed = entry is None or not user.is_same_profile(entry[1])
+        if not changed:
+            metrics.increment("user_profile.unchanged")
+        return changed
+
+    def put(self, user: User) -> None:
+        """
+        Cache profile, call only after it was saved, otherwise unsaved profile would be taken as saved
+        """
+        with self.__lock:
+            self.__entries[user.get_sub()] = (monotonic(), user)
+            self.__entries.move_to_end(user.get_sub())
+            while len(self.__entries) > self.__max_entries:
+                self.__entries.popitem(last=False)
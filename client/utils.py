@@ -1,7 +1,9 @@
+import json
+import base64
 import random
 import string
-from ssl import create_default_context, SSLContext
-from _ssl import CERT_NONE
+from typing import Union
+from ssl import create_default_context, SSLContext, CERT_NONE
 from client.config import Config
 
 
@@ -10,7 +12,10 @@ def generate_random_string() -> str:
 
 
 def get_ssl_context(config: Config) -> SSLContext:
-    ctx = create_default_context()
+    if 0 < len(config.get_ca_bundle()):
+        ctx = create_default_context(cafile=config.get_ca_bundle())
+    else:
+        ctx = create_default_context()
 
     if not config.verify_ssl_server():
         print('Not verifying ssl certificates')
@@ -24,3 +29,19 @@ def dict_key_to_camel_case(key: str) -> str:
         key = key[2:]
     ret = ''.join(x for x in key.title() if "_" != x)
     return ret[0].lower() + ret[1:]
+
+
+def decode_jwt_payload(jwt: str) -> Union[dict, None]:
+    """
+    Decode JWT claims without signature verification
+    :param jwt: serialized JWS
+    :return: claims or None when token is not a JWS
+    """
+    parts = str(jwt).split('.')
+    if len(parts) != 3:
+        return None
+    payload = parts[1] + '=' * (-len(parts[1]) % 4)
+    try:
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except ValueError:
+        return None
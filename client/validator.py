@@ -1,11 +1,13 @@
 import json
 import base64
-from urllib.request import Request, urlopen
-from jose import jws
-from jose.constants import ALGORITHMS
-from jose.exceptions import JWSError
-from client.client import get_ssl_context
+from threading import Lock
+from urllib.request import Request
 from client.config import Config
+from client.resilience import ResilientOpener
+from client.tls import tls_manager
+from client.tracing import traced
+
+_jose = None
 
 
 def base64_urldecode(s):
@@ -14,38 +16,83 @@ def base64_urldecode(s):
     return base64.urlsafe_b64decode(ascii_string)
 
 
+def load_jose():
+    """
+    python-jose and its crypto backends are imported on first validation
+    :return: tuple of jws module, ALGORITHMS and JWSError
+    """
+    global _jose
+    if _jose is None:
+        from jose import jws
+        from jose.constants import ALGORITHMS
+        from jose.exceptions import JWSError
+        _jose = (jws, ALGORITHMS, JWSError)
+    return _jose
+
+
 class JwtValidatorException(Exception):
     pass
 
 
 class JwtValidator:
     def __init__(self, config: Config):
-        print('Getting ssl context for jwks_uri')
-        self.ctx = get_ssl_context(config)
+        self.config: Config = config
+        self.ctx = None
+        self.opener = ResilientOpener(config)
+        self.jwks_uri = None
+        self.jwks = None
+        self.__warm_up_lock: Lock = Lock()
 
-        self.jwks_uri = config.get_jwks_uri()
-        self.jwks = self.get_jwks_data()
+    def warm_up(self) -> None:
+        """
+        Load ssl context, JWKS and crypto modules. Must be called after discovery, it is called by the first
+        validation otherwise.
+        """
+        with self.__warm_up_lock:
+            if self.jwks is not None:
+                return
+            print('Getting ssl context for jwks_uri')
+            self.ctx = tls_manager.get_context(self.config)
+            self.jwks_uri = self.config.get_jwks_uri()
+            load_jose()
+            self.jwks = self.get_jwks_data()
+
+    async def async_warm_up(self) -> None:
+        import asyncio
+        await asyncio.get_running_loop().run_in_executor(None, self.warm_up)
+
+    @traced("JwtValidator.validate")
+    def validate(self, jwt, iss, aud) -> dict:
+        if self.jwks is None:
+            self.warm_up()
+        jws, algorithms, jws_error = load_jose()
 
-    def validate(self, jwt, iss, aud):
         parts = jwt.split('.')
         if len(parts) != 3:
             raise JwtValidatorException('Invalid JWT. Only JWS supported.')
-        payload = json.loads(base64_urldecode(parts[1]))
+        try:
+            payload = json.loads(base64_urldecode(parts[1]))
+        except (ValueError, TypeError) as e:
+            raise JwtValidatorException("Invalid JWT payload: %s" % e)
+        if not isinstance(payload, dict):
+            raise JwtValidatorException("Invalid JWT payload")
 
-        if iss != payload['iss']:
-            raise JwtValidatorException("Invalid issuer %s, expected %s" % (payload['iss'], iss))
+        if iss != payload.get('iss'):
+            raise JwtValidatorException("Invalid issuer %s, expected %s" % (payload.get('iss'), iss))
 
-        if payload["aud"]:
-            if (isinstance(payload["aud"], str) and payload["aud"] != aud) or aud not in payload['aud']:
-                raise JwtValidatorException("Invalid audience %s, expected %s" % (payload['aud'], aud))
+        if not payload.get("aud"):
+            raise JwtValidatorException("Missing audience")
+        if (isinstance(payload["aud"], str) and payload["aud"] != aud) or aud not in payload['aud']:
+            raise JwtValidatorException("Invalid audience %s, expected %s" % (payload['aud'], aud))
 
         try:
-            jws.verify(jwt, self.jwks, ALGORITHMS.ALL)
-        except JWSError as e:
+            jws.verify(jwt, self.jwks, algorithms.ALL)
+        except jws_error as e:
             print("Exception validating signature")
             raise JwtValidatorException(e)
 
         print("Successfully validated signature.")
+        return payload
 
     def get_jwks_data(self):
         request = Request(self.jwks_uri)
@@ -53,8 +100,7 @@ class JwtValidator:
         request.add_header('User-Agent', 'CurityExample/1.0')
 
         try:
-            jwks_response = urlopen(request, context=self.ctx)
+            return self.opener.open("jwks", request, context=self.ctx, idempotent=True, hedge=True)
         except Exception as e:
             print("Error fetching JWKS", e)
             raise e
-        return jwks_response.read()
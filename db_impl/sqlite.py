@@ -4,22 +4,39 @@ from client.db_interface import OAuth2Db
 from sqlite3 import connect
 from client.session import Session
 from client.user import User
-from typing import Tuple, Union
+from client.tracing import traced
+from typing import Tuple, Union, Iterable, Iterator
 
 
 class OAuthSqlite(OAuth2Db):
     def __init__(self, db_path: str="oauth2.db"):
         super().__init__()
         self.__db_path: str = db_path
+        self.__rate_limit_table_ready: bool = False
+        self.__pending_table_ready: bool = False
         if not os.path.exists(self.__db_path):
             self.__create_db()
+        else:
+            self.__migrate_db()
 
     def __create_db(self):
         with connect(self.__db_path) as db:
             c = db.cursor()
-            c.execute("CREATE TABLE user (sub text PRIMARY KEY ASC, email text)")
+            c.execute("CREATE TABLE user (sub text PRIMARY KEY ASC, email text, claims text)")
             c.execute("CREATE TABLE session (id text PRIMARY KEY ASC, detail text)")
             c.execute("CREATE TABLE dynamic_registration (name text PRIMARY KEY ASC, configuration text)")
+            OAuthSqlite.__create_rate_limit_table(c)
+            OAuthSqlite.__create_pending_table(c)
+
+    def __migrate_db(self):
+        with connect(self.__db_path) as db:
+            columns = [row[1] for row in db.execute("PRAGMA table_info(user)").fetchall()]
+            if 0 < len(columns) and "claims" not in columns:
+                db.execute("ALTER TABLE user ADD COLUMN claims text")
+
+    @staticmethod
+    def __user_from_row(sub: str, email: str, claims: str) -> User:
+        return User(sub=sub, email=email, claims=None if claims is None else json.loads(claims))
 
     def get_session(self, session_id: str) -> Union[Tuple[Session, User], None]:
         with connect(self.__db_path) as db:
@@ -29,25 +46,32 @@ class OAuthSqlite(OAuth2Db):
                 return None
             else:
                 session = Session(session_detail=json.loads(session_row[0]))
-                user_row = c.execute("SELECT email FROM user WHERE sub = ?", (session.get_user_sub(),)).fetchone()
+                user_row = c.execute(
+                    "SELECT email, claims FROM user WHERE sub = ?",
+                    (session.get_user_sub(),)
+                ).fetchone()
                 if user_row is None or 0 == len(user_row):
                     return None
-                user = User(sub=session.get_user_sub(), email=user_row[0])
+                user = OAuthSqlite.__user_from_row(session.get_user_sub(), user_row[0], user_row[1])
                 return session, user
 
     @staticmethod
-    def __insert_update_user(db, sub: str, email: str):
+    def __insert_update_user(db, sub: str, email: str, claims: str):
         c = db.cursor()
-        user_row = c.execute("SELECT email FROM user WHERE sub = ?", (sub,)).fetchone()
+        user_row = c.execute("SELECT email, claims FROM user WHERE sub = ?", (sub,)).fetchone()
         if user_row is None or 0 == len(user_row):
-            c.execute("INSERT INTO user VALUES (?, ?)", (sub, email))
-        else:
-            c.execute("UPDATE user set email = ? WHERE sub = ?", (email, sub))
+            c.execute("INSERT INTO user (sub, email, claims) VALUES (?, ?, ?)", (sub, email, claims))
+        elif user_row[0] != email or user_row[1] != claims:
+            c.execute("UPDATE user set email = ?, claims = ? WHERE sub = ?", (email, claims, sub))
 
-    def save_session(self, session: Session, user: User) -> None:
+    @traced("OAuthSqlite.save_session")
+    def save_session(self, session: Session, user: User, save_user: bool=True) -> None:
         with connect(self.__db_path) as db:
             c = db.cursor()
-            OAuthSqlite.__insert_update_user(db, user.get_sub(), user.get_email())
+            if save_user:
+                OAuthSqlite.__insert_update_user(
+                    db, user.get_sub(), user.get_email(), json.dumps(user.get_claims(), sort_keys=True)
+                )
             c.execute("INSERT INTO session VALUES (?, ?)", (session.get_id(), str(session)))
 
     def get_dynamic_registration(self, client_name: str) -> Union[dict, None]:
@@ -76,3 +100,142 @@ class OAuthSqlite(OAuth2Db):
                     "UPDATE dynamic_registration set configuration = ? where name = ?",
                     (json.dumps(configuration), client_name)
                 )
+
+    @staticmethod
+    def __create_pending_table(c) -> None:
+        c.execute("CREATE TABLE IF NOT EXISTS pending_authorization (state text PRIMARY KEY ASC, detail text, expires real)")
+        c.execute("CREATE INDEX IF NOT EXISTS pending_authorization_expires ON pending_authorization (expires)")
+
+    def __ensure_pending_table(self, db) -> None:
+        if not self.__pending_table_ready:
+            OAuthSqlite.__create_pending_table(db.cursor())
+            self.__pending_table_ready = True
+
+    def save_pending_authorization(self, state: str, detail: str, expires_at: float, now: float, capacity: int) -> None:
+        """
+        Expired rows are deleted on every save, when capacity is reached rows closest to expiry are dropped
+        """
+        with connect(self.__db_path) as db:
+            self.__ensure_pending_table(db)
+            c = db.cursor()
+            c.execute("DELETE FROM pending_authorization WHERE expires <= ?", (now,))
+            count = c.execute("SELECT count(*) FROM pending_authorization").fetchone()[0]
+            if count >= capacity:
+                c.execute(
+                    "DELETE FROM pending_authorization WHERE state IN "
+                    "(SELECT state FROM pending_authorization ORDER BY expires LIMIT ?)",
+                    (count - capacity + 1,)
+                )
+            c.execute("INSERT INTO pending_authorization VALUES (?, ?, ?)", (state, detail, expires_at))
+
+    def take_pending_authorization(self, state: str, now: float) -> Union[str, None]:
+        with connect(self.__db_path) as db:
+            self.__ensure_pending_table(db)
+            c = db.cursor()
+            # expired rows are found through index on expires
+            c.execute("DELETE FROM pending_authorization WHERE expires <= ?", (now,))
+            row = c.execute("SELECT detail FROM pending_authorization WHERE state = ?", (state,)).fetchone()
+            if row is None:
+                return None
+            c.execute("DELETE FROM pending_authorization WHERE state = ?", (state,))
+            if 0 == c.rowcount:
+                return None
+            return row[0]
+
+    @staticmethod
+    def __create_rate_limit_table(c) -> None:
+        c.execute("CREATE TABLE IF NOT EXISTS rate_limit (key text PRIMARY KEY ASC, tokens real, updated real)")
+        c.execute("CREATE INDEX IF NOT EXISTS rate_limit_updated ON rate_limit (updated)")
+
+    def __ensure_rate_limit_table(self, db) -> None:
+        if not self.__rate_limit_table_ready:
+            OAuthSqlite.__create_rate_limit_table(db.cursor())
+            self.__rate_limit_table_ready = True
+
+    def take_rate_limit_tokens(self, key: str, rate: float, burst: int, cost: int, now: float) -> bool:
+        db = connect(self.__db_path, isolation_level=None)
+        try:
+            self.__ensure_rate_limit_table(db)
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT tokens, updated FROM rate_limit WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                tokens = float(burst)
+            else:
+                tokens = min(float(burst), row[0] + max(0.0, now - row[1]) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            db.execute("INSERT OR REPLACE INTO rate_limit VALUES (?, ?, ?)", (key, tokens, now))
+            db.execute("COMMIT")
+            return allowed
+        except Exception as e:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise e
+        finally:
+            db.close()
+
+    def prune_rate_limit(self, key_prefix: str, idle_before: float) -> None:
+        with connect(self.__db_path) as db:
+            self.__ensure_rate_limit_table(db)
+            # idle rows are found through index on updated
+            db.execute(
+                "DELETE FROM rate_limit WHERE updated < ? AND substr(key, 1, ?) = ?",
+                (idle_before, len(key_prefix), key_prefix)
+            )
+
+    def __iter_rows(self, query: str, chunk_size: int) -> Iterator[tuple]:
+        """
+        Page through table by rowid, every chunk is read by separate short statement, so the shared lock
+        is not held between chunks and logins can write while export is running
+        :param query: select with rowid as first column and placeholders for last rowid and chunk size
+        """
+        last_rowid = 0
+        while True:
+            db = connect(self.__db_path)
+            try:
+                rows = db.execute(query, (last_rowid, chunk_size)).fetchall()
+            finally:
+                db.close()
+            for row in rows:
+                yield row[1:]
+            if len(rows) < chunk_size:
+                return
+            last_rowid = rows[-1][0]
+
+    def iter_users(self, chunk_size: int=1000) -> Iterator[User]:
+        for row in self.__iter_rows(
+                "SELECT rowid, sub, email, claims FROM user WHERE rowid > ? ORDER BY rowid LIMIT ?", chunk_size
+        ):
+            yield OAuthSqlite.__user_from_row(row[0], row[1], row[2])
+
+    def iter_sessions(self, chunk_size: int=1000) -> Iterator[Session]:
+        for row in self.__iter_rows(
+                "SELECT rowid, detail FROM session WHERE rowid > ? ORDER BY rowid LIMIT ?", chunk_size
+        ):
+            yield Session(session_detail=json.loads(row[0]))
+
+    def save_users(self, users: Iterable[User]) -> None:
+        with connect(self.__db_path) as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO user (sub, email, claims) VALUES (?, ?, ?)",
+                (
+                    (user.get_sub(), user.get_email(), json.dumps(user.get_claims(), sort_keys=True))
+                    for user in users
+                )
+            )
+
+    def save_sessions(self, sessions: Iterable[Session]) -> None:
+        with connect(self.__db_path) as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO session VALUES (?, ?)",
+                ((session.get_id(), str(session)) for session in sessions)
+            )
+
+    def compact(self) -> None:
+        db = connect(self.__db_path, isolation_level=None)
+        try:
+            db.execute("VACUUM")
+            db.execute("ANALYZE")
+        finally:
+            db.close()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Offline export, import and compaction of the OAuth2 session store.
+
+Export writes one JSON object per line (NDJSON), users first and sessions after them:
+    {"type": "user", "data": {"sub": "...", "email": "...", "claims": {...}}}
+    {"type": "session", "data": {"id": "...", "accessToken": "...", ...}}
+
+Usage:
+    python db_tool.py export --db oauth2.db --output sessions.ndjson
+    python db_tool.py import --db new.db --input sessions.ndjson --compact
+    python db_tool.py compact --db oauth2.db
+"""
+import sys
+import json
+import argparse
+from time import time
+from typing import Iterator, IO, List
+from client.db_interface import OAuth2Db
+from client.session import Session
+from client.user import User
+from db_impl.sqlite import OAuthSqlite
+
+
+RECORD_USER = "user"
+RECORD_SESSION = "session"
+
+
+def export_records(db: OAuth2Db, chunk_size: int=1000, skip_expired: bool=False) -> Iterator[str]:
+    """
+    :param db: source database
+    :param chunk_size: number of rows fetched from db at once
+    :param skip_expired: do not export sessions with expired id token, sessions themselves never expire,
+        so this drops sessions of logged in users
+    :return: NDJSON lines
+    """
+    now = int(time())
+    for user in db.iter_users(chunk_size):
+        data = {"sub": user.get_sub(), "email": user.get_email(), "claims": user.get_claims()}
+        yield json.dumps({"type": RECORD_USER, "data": data}) + "\n"
+    for session in db.iter_sessions(chunk_size):
+        if skip_expired and session.is_expired(now):
+            continue
+        yield json.dumps({"type": RECORD_SESSION, "data": session.to_dict()}) + "\n"
+
+
+def export_db(db: OAuth2Db, output: IO, chunk_size: int=1000, skip_expired: bool=False) -> int:
+    count = 0
+    for line in export_records(db, chunk_size, skip_expired):
+        output.write(line)
+        count += 1
+    return count
+
+
+def import_db(db: OAuth2Db, source: IO, batch_size: int=1000, skip_expired: bool=False) -> dict:
+    """
+    Import NDJSON records, every batch is saved in single transaction
+    :param db: target database
+    :param source: NDJSON input
+    :param batch_size: number of records saved in one transaction
+    :param skip_expired: do not import sessions with expired id token, see export_records
+    :return: counters of imported and skipped records
+    """
+    now = int(time())
+    stats = {"users": 0, "sessions": 0, "skipped": 0}
+    users: List[User] = []
+    sessions: List[Session] = []
+    for line in source:
+        if 0 == len(line.strip()):
+            continue
+        record = json.loads(line)
+        if RECORD_USER == record["type"]:
+            users.append(User(**record["data"]))
+            if len(users) >= batch_size:
+                db.save_users(users)
+                stats["users"] += len(users)
+                users = []
+        elif RECORD_SESSION == record["type"]:
+            session = Session(session_detail=record["data"])
+            if skip_expired and session.is_expired(now):
+                stats["skipped"] += 1
+                continue
+            sessions.append(session)
+            if len(sessions) >= batch_size:
+                db.save_sessions(sessions)
+                stats["sessions"] += len(sessions)
+                sessions = []
+        else:
+            raise ValueError("Unknown record type %s" % record["type"])
+
+    if users:
+        db.save_users(users)
+        stats["users"] += len(users)
+    if sessions:
+        db.save_sessions(sessions)
+        stats["sessions"] += len(sessions)
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="OAuth2 session store maintenance")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    export_cmd = commands.add_parser("export", help="stream users and sessions to NDJSON")
+    export_cmd.add_argument("--db", default="oauth2.db")
+    export_cmd.add_argument("--output", default="-", help="output file, - for stdout")
+    export_cmd.add_argument("--chunk-size", type=int, default=1000)
+    export_cmd.add_argument("--skip-expired", action="store_true", help="drop sessions with expired id token")
+
+    import_cmd = commands.add_parser("import", help="load users and sessions from NDJSON")
+    import_cmd.add_argument("--db", default="oauth2.db")
+    import_cmd.add_argument("--input", default="-", help="input file, - for stdin")
+    import_cmd.add_argument("--batch-size", type=int, default=1000)
+    import_cmd.add_argument("--skip-expired", action="store_true", help="drop sessions with expired id token")
+    import_cmd.add_argument("--compact", action="store_true", help="run VACUUM and ANALYZE after import")
+
+    compact_cmd = commands.add_parser("compact", help="run VACUUM and ANALYZE")
+    compact_cmd.add_argument("--db", default="oauth2.db")
+
+    args = parser.parse_args(argv)
+    db: OAuth2Db = OAuthSqlite(args.db)
+    started = time()
+
+    if "export" == args.command:
+        output = sys.stdout if "-" == args.output else open(args.output, "w")
+        try:
+            count = export_db(db, output, args.chunk_size, args.skip_expired)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        print("Exported %d records in %.2fs" % (count, time() - started), file=sys.stderr)
+    elif "import" == args.command:
+        source = sys.stdin if "-" == args.input else open(args.input)
+        try:
+            stats = import_db(db, source, args.batch_size, args.skip_expired)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        print(
+            "Imported %d users and %d sessions, skipped %d expired sessions in %.2fs"
+            % (stats["users"], stats["sessions"], stats["skipped"], time() - started),
+            file=sys.stderr
+        )
+        if args.compact:
+            compact_started = time()
+            db.compact()
+            print("Compacted in %.2fs" % (time() - compact_started), file=sys.stderr)
+    else:
+        db.compact()
+        print("Compacted in %.2fs" % (time() - started), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
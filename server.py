@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-forking launcher. Discovery, dynamic registration and JWKS are loaded once in the parent process,
+workers are forked afterwards and share them copy-on-write together with the listening socket.
+
+Usage:
+    python server.py --host 127.0.0.1 --port 5000 --workers 4
+"""
+import os
+import sys
+import signal
+import socket
+import argparse
+import traceback
+from time import perf_counter, monotonic, sleep
+from werkzeug.serving import make_server
+import app
+
+RESTART_DELAY = 1.0
+
+
+def serve_worker(sock: socket.socket, host: str, port: int, secret_key: str, forked_at: float) -> None:
+    flask_app = app.create_app(secret_key)
+    server = make_server(host, port, flask_app, threaded=True, fd=sock.fileno())
+    print("Worker %d ready in %.1f ms" % (os.getpid(), (perf_counter() - forked_at) * 1000))
+    server.serve_forever()
+
+
+def spawn_worker(sock: socket.socket, host: str, port: int, secret_key: str) -> int:
+    forked_at = perf_counter()
+    pid = os.fork()
+    if 0 == pid:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # os._exit skips cleanup inherited from the parent, so the error is printed here
+        try:
+            serve_worker(sock, host, port, secret_key, forked_at)
+        except BaseException:
+            traceback.print_exc()
+            sys.stderr.flush()
+            os._exit(1)
+        os._exit(0)
+    return pid
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Pre-forking OAuth2 app server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--backlog", type=int, default=128)
+    args = parser.parse_args(argv)
+
+    started = perf_counter()
+    app.init_components(multi_process=1 < args.workers)
+    # loaded once here, so workers never race on creating the key file
+    secret_key = app.load_secret_key(app._config)
+    print("Components initialized in %.1f ms" % ((perf_counter() - started) * 1000))
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(args.backlog)
+    sock.set_inheritable(True)
+
+    # pid -> start time, workers dying right after start are restarted with delay
+    workers = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for worker_pid in workers:
+            os.kill(worker_pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(args.workers):
+        workers[spawn_worker(sock, args.host, args.port, secret_key)] = monotonic()
+    print("Listening on http://%s:%d with %d workers" % (args.host, args.port, args.workers))
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started_at = workers.pop(pid, monotonic())
+        if not stopping:
+            print("Worker %d exited with status %d, restarting" % (pid, status))
+            if monotonic() - started_at < RESTART_DELAY:
+                sleep(RESTART_DELAY)
+            workers[spawn_worker(sock, args.host, args.port, secret_key)] = monotonic()
+
+    sock.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
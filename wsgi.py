@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""
+Entry point for WSGI and ASGI servers, e.g.:
+    gunicorn --preload -w 4 wsgi:application
+    uvicorn wsgi:asgi_application
+"""
+from app import init_components, create_app
+
+# WSGI servers usually run more worker processes, so login state must be shared through db
+init_components(multi_process=True)
+application = create_app()
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+    asgi_application = WsgiToAsgi(application)
+except ImportError:
+    asgi_application = None